@@ -1,6 +1,9 @@
 """Detection methods for sawdust watcher."""
 # stdlib
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # external
 import cv2 as cv
@@ -8,12 +11,27 @@ import numpy as np
 
 LOG = logging.getLogger(__name__)
 
+_REDUCED_FLAGS = {
+    1: cv.IMREAD_COLOR,
+    2: cv.IMREAD_REDUCED_COLOR_2,
+    4: cv.IMREAD_REDUCED_COLOR_4,
+    8: cv.IMREAD_REDUCED_COLOR_8,
+}
+_THREAD_LOCAL = threading.local()  # holds each thread's pipeline buffers
+_KERNEL_CACHE = {}
 
-def load_image(img_path):
+
+def load_image(img_path, reduction=1):
     """Read a color image from specified path into numpy array.
 
+    The file is read into memory in a single call and decoded from the buffer. For
+    JPEG files, a reduction factor other than 1 decodes directly at the reduced size,
+    which is much cheaper than decoding at full size and rescaling afterwards.
+
     Args:
         img_path (str, pathlib.Path): The path to image file.
+        reduction (int): Factor by which to reduce the image size while decoding.
+            Must be 1, 2, 4 or 8. Defaults to 1.
 
     Raises:
         ValueError: Image failed to load.
@@ -21,128 +39,357 @@ def load_image(img_path):
     Returns:
         numpy.ndarray: Image array.
     """
-    img = cv.imread(filename=str(img_path), flags=cv.IMREAD_COLOR)
+    assert reduction in _REDUCED_FLAGS, "Reduction must be 1, 2, 4 or 8."
+
+    try:
+        buf = np.fromfile(str(img_path), dtype=np.uint8)
+    except OSError as e:
+        raise ValueError("Image failed to load.") from e
+
+    try:
+        img = cv.imdecode(buf, flags=_REDUCED_FLAGS[reduction])
+    except cv.error as e:  # e.g. an empty file
+        raise ValueError("Image failed to load.") from e
     if img is None:
         raise ValueError("Image failed to load.")
 
     return img
 
 
-def write_image(img, output_path):
+def write_image(img, output_path, params=None):
     """Save an image to disk.
 
     Args:
         img (numpy.ndarray): The image array to save.
-        output_path (str, pathlib.Path): The path and filename to save image to.
+        output_path (pathlib.Path): The path and filename to save image to.
+        params (list): Format-specific encoding parameters passed to cv.imwrite.
+            Defaults to None.
+
+    Raises:
+        ValueError: Image failed to save.
 
     Returns:
-        bool: True if the image was successfully saved, False otherwise.
+        bool: True if the image was successfully saved.
     """
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    result = cv.imwrite(filename=str(output_path), img=img)
+    result = cv.imwrite(filename=str(output_path), img=img, params=params or [])
 
     if not result:
         raise ValueError("Image failed to save.")
 
+    return result
+
 
-def rescale_image(img, scale):
+def rescale_image(img, scale, dst=None):
     """Resize an image to a specified scale.
 
+    Area interpolation is used to preserve the fine-grained texture the detector
+    relies on. OpenCV has a vectorized fast path for it when 1/scale is an integer
+    (e.g. 0.5 or 0.25), so such scales are preferable when downsampling.
+
     Args:
         img (numpy.ndarray): Image to resize.
         scale (float): Scaling factor.
+        dst (numpy.ndarray): Preallocated output array of the rescaled size.
+            Defaults to None, in which case a new array is allocated.
 
     Returns:
         numpy.ndarray: Rescaled image.
     """
     dim = (int(img.shape[1] * scale), int(img.shape[0] * scale))
-    img = cv.resize(img, dim, interpolation=cv.INTER_AREA)
+    img = cv.resize(img, dim, dst=dst, interpolation=cv.INTER_AREA)
 
     return img
 
 
-def white_pixel_ratio(img):
+def montage(imgs):
+    """Concatenate images of equal height side by side into a single color image.
+
+    Args:
+        imgs (iterable): Image arrays to concatenate. Single-channel images are
+            converted to BGR.
+
+    Returns:
+        numpy.ndarray: Montage image array.
+    """
+    return cv.hconcat(
+        [cv.cvtColor(img, cv.COLOR_GRAY2BGR) if img.ndim == 2 else img for img in imgs]
+    )
+
+
+def white_pixel_ratio(img, mask=None):
     """Calculates the ratio of white pixels to the total number of pixels in an image.
 
     Args:
-        img (numpy.ndarray): Image array.
+        img (numpy.ndarray): Binary single-channel image array (0 or 255).
+        mask (numpy.ndarray): Binary mask of the same shape selecting the region of
+            interest. If given, the ratio is computed over the masked pixels only.
+            Defaults to None.
+
+    Returns:
+        float: Ratio of white pixels. 0.0 if the mask selects no pixels.
+    """
+    if mask is not None:
+        mask_pixels = cv.countNonZero(mask)
+        if mask_pixels == 0:
+            return 0.0
+        return cv.countNonZero(cv.bitwise_and(img, mask)) / mask_pixels
+
+    return cv.countNonZero(img) / img.size
+
+
+def otsu_threshold(img):
+    """Compute Otsu's threshold for a grayscale image.
+
+    The between-class variance of every candidate threshold is evaluated at once
+    from cumulative sums over the image histogram.
+
+    Args:
+        img (numpy.ndarray): Single-channel uint8 image array.
+
+    Returns:
+        int: Threshold value maximizing the between-class variance.
+    """
+    hist = np.bincount(img.ravel(), minlength=256).astype(np.float64)
+    weight_lo = np.cumsum(hist)
+    weight_hi = weight_lo[-1] - weight_lo
+    moment = np.cumsum(hist * np.arange(256))
+    mean_lo = moment / np.maximum(weight_lo, 1)
+    mean_hi = (moment[-1] - moment) / np.maximum(weight_hi, 1)
+    variance = weight_lo * weight_hi * (mean_lo - mean_hi) ** 2
+
+    return int(np.argmax(variance))
+
+
+class ThresholdTracker:
+    """Slowly adapting Otsu threshold for a fixed camera and lighting setup.
+
+    Otsu's threshold is only recomputed every few frames and blended into an
+    exponential moving average. The frames in between reuse the average, skipping
+    the histogram computation entirely.
+
+    Args:
+        interval (int): Number of frames between Otsu updates. Defaults to 30.
+        alpha (float): Smoothing factor of the moving average. Defaults to 0.02.
+    """
+
+    def __init__(self, interval=30, alpha=0.02):
+        self.interval = interval
+        self.alpha = alpha
+        self.average = None
+        self.count = 0
+
+    def update(self, img):
+        """Get the threshold for the next frame.
+
+        Args:
+            img (numpy.ndarray): Single-channel uint8 image array of the frame.
+
+        Returns:
+            int: Threshold value.
+        """
+        if self.count % self.interval == 0:
+            threshold = otsu_threshold(img)
+            if self.average is None:  # seed the average with the first frame
+                self.average = threshold
+            else:
+                self.average += self.alpha * (threshold - self.average)
+        self.count += 1
+
+        return round(self.average)
+
+
+def _get_buffers(shape, rescale=False):
+    """Get the pipeline output buffers for an image size.
+
+    Buffers are allocated on first use and reused by every later call with the same
+    image size from the same thread. Only the buffers for the most recent image size
+    are kept, and the color buffer for the rescaled original is only allocated once
+    it is needed.
+
+    Args:
+        shape (tuple): Height and width of the image.
+        rescale (bool): Whether a buffer for the rescaled color image is needed.
+            Defaults to False.
+
+    Returns:
+        dict: Preallocated uint8 arrays keyed by pipeline step.
+    """
+    bufs = getattr(_THREAD_LOCAL, "buffers", None)
+    if bufs is None or bufs["grayscale"].shape != shape:
+        bufs = _THREAD_LOCAL.buffers = {
+            step: np.empty(shape, dtype=np.uint8)
+            for step in ("grayscale", "denoise", "difference", "threshold", "morph")
+        }
+
+    if rescale and "original" not in bufs:
+        bufs["original"] = np.empty((*shape, 3), dtype=np.uint8)
+
+    return bufs
+
+
+def _get_kernel(size):
+    """Get a square rectangular structuring element, cached by size.
+
+    Args:
+        size (int): Width and height of the structuring element.
+
+    Returns:
+        numpy.ndarray: Structuring element.
     """
-    return np.sum(img == 255) / img.size
+    if size not in _KERNEL_CACHE:
+        _KERNEL_CACHE[size] = cv.getStructuringElement(cv.MORPH_RECT, (size, size))
 
+    return _KERNEL_CACHE[size]
 
-def detect(img, noise_size=11, threshold=32, morph_size=5, interactive=False):
+
+def detect(
+    img,
+    noise_size=11,
+    threshold=32,
+    morph_size=5,
+    scale=1.0,
+    denoise="median",
+    interactive=False,
+):
     """Detect sawdust coverage in an image.
 
     The technique used involves the use of a denoising filter to act as a sawdust
     particle segmentator. The image processing pipeline is as follows:
-    1. Denoise the image.
-    2. Find the difference between the original image and the denoised image. This
+    1. Downsample the image. The coverage ratio is scale-invariant, so this only
+        reduces the number of pixels every later step has to process.
+    2. Convert image to grayscale. Sawdust shows up as luminance contrast, so the
+        remaining steps only need to process a single channel.
+    3. Denoise the image.
+    4. Find the difference between the grayscale image and the denoised image. This
         effectivly isolates the noise (dust).
-    3. Convert image to grayscale.
-    4. Threshold the image.
-    5. Apply a morphological closing operation to collect disparate particles.
-    6. Calculate ratio of white pixels to total pixels (dust coverage).
+    5. Threshold the image.
+    6. Apply a morphological closing operation to collect disparate particles.
+    7. Calculate ratio of white pixels to total pixels (dust coverage).
 
     Args:
         img (numpy.ndarray): The image to be analysed.
         noise_size (int): The size of the denoising filter kernal. Must be odd.
             Defaults to 11.
-        threshold (int): The threshold value for the image. Must be between 0 and 255.
-            Defaults to 32.
+        threshold (int, None, ThresholdTracker): The threshold value for the image.
+            Must be between 0 and 255. If None, the threshold is computed using
+            Otsu's method. If a ThresholdTracker, the threshold is taken from its
+            moving average. Defaults to 32.
         morph_size (int): The size of the morphological closing kernal. Must be odd.
             Defaults to 5.
+        scale (float): Scaling factor applied to the image before processing.
+            Defaults to 1.0 (no rescaling).
+        denoise (str): The denoising filter, either "median" or "gaussian". The
+            gaussian filter is separable and considerably cheaper for large kernels,
+            but the default thresholds are tuned for the median filter.
+            Defaults to "median".
         interactive (bool): If True, images will be previewed at each step in the
             pipeline. Defaults to False.
 
     Returns:
         ratio (float): Sawdust coverage ratio.
         img_pipe (dict): Dictionary containing images at each step in the pipeline.
+            The images are reused buffers that are overwritten by the next call
+            with the same image size in the same thread; copy them if they need to
+            outlive it.
     """
 
     assert noise_size % 2 != 0, "Noise kernal size must be an odd number."
-    assert 0 <= threshold <= 255, "Threshold must be between 0 and 255."
+    adaptive = threshold is None or isinstance(threshold, ThresholdTracker)
+    assert adaptive or 0 <= threshold <= 255, "Threshold must be between 0 and 255."
     assert morph_size % 2 != 0, "Morphological kernel size must be an odd number."
+    assert denoise in ("median", "gaussian"), "Unknown denoising filter."
+
+    if scale != 1.0:
+        shape = (int(img.shape[0] * scale), int(img.shape[1] * scale))
+        bufs = _get_buffers(shape, rescale=True)
+        img = rescale_image(img, scale, dst=bufs["original"])
+    else:
+        bufs = _get_buffers(img.shape[:2])
 
     img_pipe = {}
     img_pipe["original"] = img
 
+    # grayscale
+    img_gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY, dst=bufs["grayscale"])
+    img_pipe["grayscale"] = img_gray
+    if interactive:
+        cv.imshow("Grayscale", img_gray)
+        cv.waitKey(0)
+
     # denoise
-    img_denoise = cv.medianBlur(img, noise_size)
+    if denoise == "median":
+        img_denoise = cv.medianBlur(img_gray, noise_size, dst=bufs["denoise"])
+    else:
+        img_denoise = cv.GaussianBlur(
+            img_gray, (noise_size, noise_size), 0, dst=bufs["denoise"]
+        )
     img_pipe["denoise"] = img_denoise
     if interactive:
         cv.imshow("Denoise", img_denoise)
         cv.waitKey(0)
 
     # difference
-    img_diff = cv.subtract(img, img_denoise)
+    img_diff = cv.subtract(img_gray, img_denoise, dst=bufs["difference"])
     img_pipe["difference"] = img_diff
     if interactive:
         cv.imshow("Difference", img_diff)
         cv.waitKey(0)
 
-    # grayscale
-    img_gray = cv.cvtColor(img_diff, cv.COLOR_BGR2GRAY)
-    img_pipe["grayscale"] = img_gray
-    if interactive:
-        cv.imshow("Grayscale", img_gray)
-        cv.waitKey(0)
-
     # threshold
-    _, img_thresh = cv.threshold(img_gray, threshold, 255, cv.THRESH_BINARY)
+    if threshold is None:
+        threshold = otsu_threshold(img_diff)
+    elif adaptive:
+        threshold = threshold.update(img_diff)
+    img_thresh = cv.compare(img_diff, threshold, cv.CMP_GT, dst=bufs["threshold"])
     img_pipe["threshold"] = img_thresh
     if interactive:
         cv.imshow("Threshold", img_thresh)
         cv.waitKey(0)
 
     # morphological transformation
-    kernal = np.ones((morph_size, morph_size), np.uint8)
-    img_morph = cv.morphologyEx(img_thresh, cv.MORPH_CLOSE, kernal, iterations=3)
+    # three closing iterations with a rectangular kernel are equivalent to a single
+    # closing with a kernel of size 3 * (morph_size - 1) + 1
+    kernal = _get_kernel(3 * (morph_size - 1) + 1)
+    img_morph = cv.morphologyEx(img_thresh, cv.MORPH_CLOSE, kernal, dst=bufs["morph"])
     img_pipe["morph"] = img_morph
     if interactive:
         cv.imshow("Morph", img_morph)
         cv.waitKey(0)
+        cv.destroyAllWindows()
 
     # ratio
     ratio = white_pixel_ratio(img_morph)
 
     return ratio, img_pipe
+
+
+def detect_batch(frames, max_workers=None, **kwargs):
+    """Detect sawdust coverage in a sequence of images.
+
+    Frames are processed in parallel by a pool of threads; OpenCV releases the GIL
+    while it works. Each thread keeps its own pipeline buffers and reuses them across
+    consecutive frames of the same size. A ThresholdTracker is not thread-safe and
+    cannot be passed as threshold.
+
+    Args:
+        frames (iterable): The images to be analysed, e.g. a list of images or an
+            array of shape (N, H, W, 3).
+        max_workers (int): Number of worker threads. Defaults to None, in which case
+            one thread per CPU is used.
+        **kwargs: Detection parameters passed on to detect.
+
+    Returns:
+        numpy.ndarray: Sawdust coverage ratio of each frame.
+    """
+
+    assert not isinstance(
+        kwargs.get("threshold"), ThresholdTracker
+    ), "ThresholdTracker cannot be shared between threads."
+
+    def detect_ratio(frame):
+        ratio, _ = detect(frame, **kwargs)
+        return ratio
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        return np.array(list(executor.map(detect_ratio, frames)))
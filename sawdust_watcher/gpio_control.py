@@ -1,32 +1,47 @@
 """Methods for controlling GPIO on raspberry pi."""
-# stdlib
-import time
-
 # external
 import numpy as np
 import picamera
 
+WARMUP_TIME = 3  # seconds for the camera sensor to settle after starting
+
+
+def start_camera(resolution=(720, 480)):
+    """Open the camera and start its preview pipeline.
 
-def grab_frame(resolution=(720, 480)):
-    """Capture a frame from the camera and save to disk.
+    The camera is meant to be opened once and kept open between captures, so that
+    the warmup and sensor configuration are only paid for at startup. This function
+    does not block while the sensor settles; callers should wait WARMUP_TIME seconds
+    before the first capture.
 
     Args:
-        camera (gpiozero.PiCamera): The camera object.
-        output_path (pathlib.Path): Output path in which to save the image.
-        resolution (tuple): The resolution of the image to capture.
+        resolution (tuple): The resolution of the images to capture.
             Defaults to (720,480).
 
     Returns:
-        (numpy.ndarray): The numpy array containing the image data.
+        (picamera.PiCamera): The open camera object.
     """
+    camera = picamera.PiCamera()
+    camera.resolution = resolution
+    camera.start_preview()
+
+    return camera
+
 
-    with picamera.PiCamera() as camera:
-        camera.resolution = resolution
-        camera.start_preview()
+def grab_frame(camera):
+    """Capture a frame from the camera.
 
-        time.sleep(3)  # warmup camera
+    The frame is captured through the video port, which reuses the running preview
+    pipeline instead of reconfiguring the sensor for a still capture.
 
-        img = np.empty((resolution[1], resolution[0], 3), dtype=np.uint8)
-        camera.capture(img, "bgr")
+    Args:
+        camera (picamera.PiCamera): The camera object, as returned by start_camera.
+
+    Returns:
+        (numpy.ndarray): The numpy array containing the image data.
+    """
+    width, height = camera.resolution
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    camera.capture(img, "bgr", use_video_port=True)
 
     return img
@@ -9,12 +9,17 @@ Options:
 """
 
 # stdlib
+import ast
 import configparser
 import logging
+import os
+import queue
+import threading
 import time
 from pathlib import Path
 
 # external
+import cv2 as cv
 from docopt import docopt
 from gpiozero import LED, Button, Buzzer
 
@@ -26,6 +31,57 @@ except ModuleNotFoundError:  # import as standalone
     import detection
     import gpio_control
 
+IMAGE_QUEUE = queue.Queue(maxsize=8)  # bounded so a stalled disk cannot exhaust RAM
+PNG_PARAMS = [
+    cv.IMWRITE_PNG_COMPRESSION,
+    1,
+    cv.IMWRITE_PNG_STRATEGY,
+    cv.IMWRITE_PNG_STRATEGY_RLE,
+]  # fast settings for the mostly-binary pipeline montages
+POLL_PERIOD = 0.05  # seconds between main loop iterations
+WRITER_TIMEOUT = 10  # seconds to wait for queued images on shutdown
+_STAMP_CACHE = [None, ""]  # [epoch second, formatted time stamp]
+
+
+def now_stamp():
+    """Get the current local time as a time stamp string.
+
+    The formatted string is cached and only recomputed when the second changes.
+
+    Returns:
+        str: Time stamp formatted as "%Y-%m-%d %H:%M:%S".
+    """
+    now = int(time.time())
+    if now != _STAMP_CACHE[0]:
+        _STAMP_CACHE[0] = now
+        _STAMP_CACHE[1] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+
+    return _STAMP_CACHE[1]
+
+
+def image_writer():
+    """Write queued images to disk.
+
+    Runs in a background thread, consuming (img, output_path) tuples from
+    IMAGE_QUEUE so that the main loop never blocks on disk I/O, until a None
+    sentinel is queued. Images are encoded as PNG using PNG_PARAMS.
+    """
+    LOG = logging.getLogger(__name__)
+
+    while True:
+        item = IMAGE_QUEUE.get()
+        if item is None:
+            IMAGE_QUEUE.task_done()
+            return
+
+        img, output_path = item
+        try:
+            detection.write_image(img=img, output_path=output_path, params=PNG_PARAMS)
+        except Exception:  # pylint: disable=broad-except
+            LOG.exception(f"Failed to save image '{output_path}'")
+        finally:
+            IMAGE_QUEUE.task_done()
+
 
 def run(output_path, config):
     """Run the main loop.
@@ -37,7 +93,7 @@ def run(output_path, config):
     output_path = Path(output_path).expanduser()  # expands ~ to home directory (unix)
 
     # region logging config
-    log_time_stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    log_time_stamp = now_stamp()
     log_path = output_path / "logs"
     log_path.mkdir(parents=True, exist_ok=True)
     log_file_path = (log_path / log_time_stamp).with_suffix(".log")
@@ -53,64 +109,122 @@ def run(output_path, config):
     LOG = logging.getLogger(__name__)
     # endregion
 
+    # region opencv config
+    cv.setUseOptimized(True)
+    cv.setNumThreads(os.cpu_count())
+    LOG.debug(f"OpenCV build information:\n{cv.getBuildInformation()}")
+    # endregion
+
+    scan_interval = config.getint("op", "scan_interval")
+    save_images = config.getboolean("op", "save_images")
+    coverage_threshold = config.getfloat("op", "coverage_threshold_percent") / 100
+    noise_size = config.getint("detect", "noise_size")
+    threshold = config.get("detect", "threshold")
+    if threshold == "otsu":
+        threshold = None
+    elif threshold == "adaptive":
+        threshold = detection.ThresholdTracker()
+    else:
+        threshold = int(threshold)
+    morph_size = config.getint("detect", "morph_size")
+    scale = config.getfloat("detect", "scale")
+    denoise = config.get("detect", "denoise")
+
     # region gpio instantiation
     led = LED(config.getint("gpio", "led"))
     buzzer = Buzzer(config.getint("gpio", "buzzer"))
     button = Button(config.getint("gpio", "button"))
+    camera = gpio_control.start_camera(
+        ast.literal_eval(config.get("camera", "resolution"))
+    )
     # endregion
 
-    LOG.info("Starting sawdust watcher script")
-
-    time_start = time.time()
-    alarm_active = False
-
-    while True:
-
-        if not alarm_active:
-            if time.time() >= time_start + config.getint("op", "scan_interval"):
-                LOG.info("Scanning area for sawdust")
-
-                img = gpio_control.grab_frame(
-                    eval(config.get("camera", "resolution")),
-                )
-                coverage_ratio, img_pipe = detection.detect(
-                    img=img,
-                    noise_size=config.getint("detect", "noise_size"),
-                    threshold=config.getint("detect", "threshold"),
-                    morph_size=config.getint("detect", "morph_size"),
-                )
-
-                time_stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-                for key, value in img_pipe.items():
-                    detection.write_image(
-                        img=value,
-                        output_path=(
-                            output_path / "images" / time_stamp / key
-                        ).with_suffix(".png"),
+    writer = None
+    try:
+        image_path = output_path / "images"
+        if save_images:
+            writer = threading.Thread(target=image_writer, daemon=True)
+            writer.start()
+
+        LOG.info("Starting sawdust watcher script")
+
+        # monotonic deadline of the next scan, no earlier than the camera warmup
+        next_scan = time.monotonic() + max(scan_interval, gpio_control.WARMUP_TIME)
+        alarm_active = False
+
+        while True:
+
+            if not alarm_active:
+                if time.monotonic() >= next_scan:
+                    LOG.info("Scanning area for sawdust")
+
+                    img = gpio_control.grab_frame(camera)
+                    coverage_ratio, img_pipe = detection.detect(
+                        img=img,
+                        noise_size=noise_size,
+                        threshold=threshold,
+                        morph_size=morph_size,
+                        scale=scale,
+                        denoise=denoise,
                     )
 
-                LOG.info(f"Sawdust detected at {round(coverage_ratio*100,2)}% coverage")
-
-                if (
-                    coverage_ratio
-                    >= config.getfloat("op", "coverage_threshold_percent") / 100
-                ):
-                    LOG.info("Sawdust coverage exceeds threshold. Activating alarm")
-                    alarm_active = True
-                    led.on()
-                    buzzer.on()
-                else:
+                    if save_images:
+                        time_stamp = now_stamp()
+                        # the montage is a new array, so it is safe to hand to the
+                        # writer thread while the pipeline buffers are reused by the
+                        # next scan
+                        try:
+                            IMAGE_QUEUE.put_nowait(
+                                (
+                                    detection.montage(img_pipe.values()),
+                                    (image_path / time_stamp).with_suffix(".png"),
+                                )
+                            )
+                        except queue.Full:
+                            LOG.warning("Image queue is full. Dropping scan images")
+
                     LOG.info(
-                        "Sawdust coverage under threshold. Waiting for next scan interval"
+                        f"Sawdust detected at {round(coverage_ratio*100,2)}% coverage"
                     )
-                    time_start = time.time()
-
-        if button.is_pressed:
-            LOG.info("Button pressed. Resetting alarm")
-            alarm_active = False
-            time_start = time.time()
-            buzzer.off()
-            led.off()
+
+                    if coverage_ratio >= coverage_threshold:
+                        LOG.info("Sawdust coverage exceeds threshold. Activating alarm")
+                        alarm_active = True
+                        led.on()
+                        buzzer.on()
+                    else:
+                        LOG.info(
+                            "Sawdust coverage under threshold. "
+                            "Waiting for next scan interval"
+                        )
+                        next_scan = time.monotonic() + scan_interval
+
+            if button.is_pressed:
+                LOG.info("Button pressed. Resetting alarm")
+                alarm_active = False
+                next_scan = time.monotonic() + scan_interval
+                buzzer.off()
+                led.off()
+
+            # sleep until the next scan is due, waking up often enough to poll the
+            # button. No scan is due while the alarm is active, so just poll
+            if alarm_active:
+                time.sleep(POLL_PERIOD)
+            else:
+                time.sleep(min(POLL_PERIOD, max(0, next_scan - time.monotonic())))
+    finally:
+        LOG.info("Shutting down sawdust watcher script")
+        camera.close()
+        if writer is not None:
+            # let the writer finish the queued montages, but don't hang on a stalled
+            # disk or a dead writer
+            try:
+                IMAGE_QUEUE.put(None, timeout=WRITER_TIMEOUT)
+                writer.join(timeout=WRITER_TIMEOUT)
+            except queue.Full:
+                pass
+            if writer.is_alive():
+                LOG.warning("Image writer did not finish. Queued images are lost")
 
 
 if __name__ == "__main__":
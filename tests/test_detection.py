@@ -1,6 +1,7 @@
 """Tests for detection functionality."""
 # stdlib
 import logging
+import math
 from pathlib import Path
 
 # external
@@ -16,11 +17,27 @@ output_path = Path("output")
 LOG = logging.getLogger(__name__)
 
 
+@pytest.fixture(scope="session")
+def load_image():
+    """Image loader that decodes each test image once per session."""
+    cache = {}
+
+    def load(img_path, reduction=1):
+        key = (str(img_path), reduction)
+        if key not in cache:
+            img = detection.load_image(img_path, reduction=reduction)
+            img.flags.writeable = False  # shared between tests
+            cache[key] = img
+        return cache[key]
+
+    return load
+
+
 def test_white_pixel_ratio():
     """Test the white pixel ratio function."""
     LOG.info("Computing white pixel ratio")
 
-    img = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255]])
+    img = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255]], dtype=np.uint8)
     LOG.info(f"Test image array:\n{img}")
 
     ratio = detection.white_pixel_ratio(img)
@@ -29,12 +46,62 @@ def test_white_pixel_ratio():
     assert ratio == 1 / 3
 
 
-def test_load_img():
+def test_white_pixel_ratio_mask():
+    """Test the white pixel ratio function over a region of interest."""
+    img = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255]], dtype=np.uint8)
+    mask = np.array([[255, 255, 0], [255, 255, 0], [0, 0, 0]], dtype=np.uint8)
+    LOG.info(f"Test image array:\n{img}\nMask array:\n{mask}")
+
+    ratio = detection.white_pixel_ratio(img, mask=mask)
+    LOG.info(f"Ratio: {ratio}")
+
+    assert ratio == 2 / 4
+
+
+def test_white_pixel_ratio_empty_mask():
+    """Test the white pixel ratio function over an empty region of interest."""
+    img = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255]], dtype=np.uint8)
+    mask = np.zeros_like(img)
+
+    ratio = detection.white_pixel_ratio(img, mask=mask)
+    LOG.info(f"Ratio: {ratio}")
+
+    assert ratio == 0.0
+
+
+def test_otsu_threshold():
+    """Test the Otsu threshold function on a bimodal image."""
+    img = np.full((4, 4), 50, dtype=np.uint8)
+    img[:, 2:] = 200
+    LOG.info(f"Test image array:\n{img}")
+
+    threshold = detection.otsu_threshold(img)
+    LOG.info(f"Threshold: {threshold}")
+
+    assert 50 <= threshold < 200
+
+
+def test_threshold_tracker():
+    """Test that the threshold tracker only updates on its interval."""
+    img = np.full((4, 4), 50, dtype=np.uint8)
+    img[:, 2:] = 200
+    img_dark = img // 2
+
+    tracker = detection.ThresholdTracker(interval=2, alpha=0.5)
+    thresholds = [tracker.update(frame) for frame in (img, img_dark, img_dark)]
+    LOG.info(f"Thresholds: {thresholds}")
+
+    otsu, otsu_dark = detection.otsu_threshold(img), detection.otsu_threshold(img_dark)
+    assert thresholds[0] == thresholds[1] == otsu
+    assert thresholds[2] == round((otsu + otsu_dark) / 2)
+
+
+def test_load_img(load_image):
     """Test the image loading function."""
     img_path = "data/test_coins_a.jpg"
 
     LOG.info(f"Loading image '{img_path}'")
-    img = detection.load_image(img_path)
+    img = load_image(img_path)
 
     LOG.info(f"Type:\t{type(img)}")
     LOG.info(f"Shape:\t{img.shape}")
@@ -42,6 +109,29 @@ def test_load_img():
     LOG.info(f"Dtype:\t{img.dtype}")
 
 
+def test_load_img_empty(tmp_path):
+    """Test that loading an empty file fails with a ValueError."""
+    img_path = tmp_path / "empty.jpg"
+    img_path.touch()
+
+    LOG.info(f"Loading image '{img_path}'")
+    with pytest.raises(ValueError):
+        detection.load_image(img_path)
+
+
+def test_load_img_reduced(load_image):
+    """Test the image loading function with reduced-size decoding."""
+    img_path = data_path / "test_coins_a.jpg"
+
+    LOG.info(f"Loading image '{img_path}' at full and quarter size")
+    img = load_image(img_path)
+    img_reduced = load_image(img_path, reduction=4)
+
+    LOG.info(f"Shapes:\t{img.shape}, {img_reduced.shape}")
+    assert img_reduced.shape[0] == math.ceil(img.shape[0] / 4)
+    assert img_reduced.shape[1] == math.ceil(img.shape[1] / 4)
+
+
 def test_write_image():
     """Test the image writing function."""
     output_img_path = output_path / "test_img.png"
@@ -51,12 +141,31 @@ def test_write_image():
     assert detection.write_image(img=img, output_path=output_img_path)
 
 
+def test_detect_batch(load_image):
+    """Test that batch detection matches detection on individual frames."""
+    frames = [
+        load_image(data_path / name, reduction=8)
+        for name in ("test_coins_a.jpg", "test_coins_b.jpg")
+    ]
+
+    LOG.info(f"Detecting sawdust in {len(frames)} frames")
+    ratios = detection.detect_batch(frames, threshold=None)
+    LOG.info(f"Sawdust coverage: {ratios}")
+
+    assert ratios.shape == (len(frames),)
+    for frame, ratio in zip(frames, ratios):
+        assert ratio == detection.detect(frame, threshold=None)[0]
+
+    with pytest.raises(AssertionError):
+        detection.detect_batch(frames, threshold=detection.ThresholdTracker())
+
+
 @pytest.mark.star
-def test_detect():
+def test_detect(load_image):
     """Test the detection function."""
     img_path = data_path / "test_assorted.jpg"
 
-    img = detection.load_image(img_path)
+    img = load_image(img_path)
     img = detection.rescale_image(img=img, scale=0.25)
 
     LOG.info(f"Detecting sawdust in '{img_path}'")